@@ -74,6 +74,9 @@ WECS_CONFIG = [
 
 # MAS config
 START_DATE = '2016-01-01T00:00:00+01:00'  # CET
+# The MAS starts one container (process) per CPU core for the WecsAgents, but
+# we don't need more containers than agents:
+MAX_CONTAINERS = sum(n_wecs for n_wecs, _ in WECS_CONFIG)
 CONTROLLER_CONFIG = {
     'max_windpark_feedin': 7000,  # Maximum power output of all WECS in kW
     'check_interval': 60 * 15,  # How often check the current feed-in
@@ -93,28 +96,26 @@ def main():
     wecssim = world.start('WecsSim', wind_file=WIND_FILE)
     mas = world.start('MAS',
                       start_date=START_DATE,
-                      controller_config=CONTROLLER_CONFIG)
+                      controller_config=CONTROLLER_CONFIG,
+                      max_containers=MAX_CONTAINERS)
 
     # Create WECS and agent instances/entities.
     #
-    # We will create one (WECS, agent) pair at a time and immediately connect
-    # them.  This way, we can easily make sure they both have the same config
-    # values and thus represent the same WECS.
-    #
-    # It would also be possible to create multiple WECS/agent and the same time
-    # via "wecssim.WECS.create(n_wecs, **params)" but it would make connecting
-    # the right WECS to right agent a bit more complicated and error prone:
+    # For each config set, we create all WECS and all agents with a single
+    # "create()" call each.  Both lists are in the same order and have the
+    # same config values, so we can just zip them to connect each WECS to the
+    # agent that represents it:
     wecs = []
     for n_wecs, params in WECS_CONFIG:  # Iterate over the config sets
-        for _ in range(n_wecs):
-            w = wecssim.WECS(**params)
-            a = mas.WecsAgent(**params)
+        ws = wecssim.WECS.create(n_wecs, **params)
+        agents = mas.WecsAgent.create(n_wecs, **params)
+        for w, a in zip(ws, agents):
             # Connect "w.P" to "a.P" and allow "a" to do async. requests to "w"
             # (e.g., set_data() to set new P_max to "w"):
             world.connect(w, a, 'P', async_requests=True)
 
-            # Remember the WECS entity for connecting it to the DB later:
-            wecs.append(w)
+        # Remember the WECS entities for connecting them to the DB later:
+        wecs.extend(ws)
 
     # Start the database process and connect all WECS entities to it:
     db = world.start('DB', step_size=60*15, duration=DURATION)
@@ -1,3 +1,11 @@
+"""
+Entry point for the agent containers running in sub-processes.
+
+Each container has a :class:`Manager` agent.  The master process uses it to
+spawn WecsAgents and to talk to all WecsAgents of a container at once.  This
+way, we need only one RPC per container instead of one per agent.
+
+"""
 import asyncio
 import logging
 
@@ -7,6 +15,9 @@ import click
 from . import util
 
 
+logger = logging.getLogger('mas.container')
+
+
 @click.command()
 @click.option('--start-date', required=True,
               callback=util.validate_start_date,
@@ -16,15 +27,91 @@ from . import util
               type=click.Choice(
                   ['debug', 'info', 'warning', 'error', 'critical']),
               help='Log level for the MAS')
-@click.argument('addr', metavar='HOST:PORT', callback=util.validate_addr)
+@click.argument('addr', metavar='HOST:PORT|ipc://PATH',
+                callback=util.validate_addr)
 def main(addr, start_date, log_level):
     logging.basicConfig(level=getattr(logging, log_level.upper()))
     try:
         container_kwargs = util.get_container_kwargs(start_date)
-        aiomas.run(aiomas.subproc.start(addr, **container_kwargs))
+        aiomas.run(start(addr, **container_kwargs))
     finally:
         asyncio.get_event_loop().close()
 
 
+async def start(addr, **container_kwargs):
+    """Start a container with a :class:`Manager` agent and run it until the
+    manager receives a *stop* message.
+
+    This is the same as :func:`aiomas.subproc.start()`, but it uses our own
+    :class:`Manager`.
+
+    """
+    container = await aiomas.Container.create(addr, as_coro=True,
+                                              **container_kwargs)
+    try:
+        manager = Manager(container)
+        await manager.stop_received
+    except KeyboardInterrupt:
+        logger.info('Execution interrupted by user')
+    finally:
+        await container.shutdown(as_coro=True)
+
+
+class Manager(aiomas.subproc.Manager):
+    """Manager agent that also knows all WecsAgents of its container.
+
+    It allows the MosaikAgent and the Controller to update or query all local
+    WecsAgents with a single RPC.  The manager calls the agents' methods
+    directly, because they live in the same process.
+
+    """
+    def __init__(self, container):
+        super().__init__(container)
+        self.agents = {}  # agent_id: agent_instance
+
+    @aiomas.expose
+    async def spawn_agent(self, aid, qualname, *args, **kwargs):
+        """Spawn a new agent (see :meth:`spawn()`) and remember it as *aid*.
+
+        Return a proxy to the agent and its address.
+
+        """
+        assert aid not in self.agents
+        agent, addr = await self.spawn(qualname, *args, **kwargs)
+        self.agents[aid] = agent
+        return agent, addr
+
+    @aiomas.expose
+    def step(self, time, data):
+        """Set the container's time to *time* and forward the state for each
+        agent in the dict *data* ``{aid: state}``.
+
+        This combines :meth:`set_time()` and the agent updates in a single
+        RPC.
+
+        """
+        self.set_time(time)
+        for aid, state in data.items():
+            self.agents[aid].update_state(state)
+
+    @aiomas.expose
+    def get_P(self, aids):
+        """Return a list with the current power output for each agent in
+        *aids*."""
+        return [self.agents[aid].get_P() for aid in aids]
+
+    @aiomas.expose
+    def set_P_max(self, P_max):
+        """Set new power limits from the dict *P_max* ``{aid: P_max}``."""
+        for aid, value in P_max.items():
+            self.agents[aid].set_P_max(value)
+
+    @aiomas.expose
+    def get_P_max(self, aids):
+        """Return a list with the current power limit for each agent in
+        *aids*."""
+        return [self.agents[aid].get_P_max() for aid in aids]
+
+
 if __name__ == '__main__':
     main()
@@ -1,6 +1,9 @@
+from datetime import timedelta
 import asyncio
+import math
 
 import aiomas
+import numpy as np
 
 
 class Controller(aiomas.Agent):
@@ -20,10 +23,21 @@ class Controller(aiomas.Agent):
         self.check_interval = check_interval
         self.max_windpark_feedin = max_windpark_feedin
 
-        self.wecs = []  # List of WecsAgent proxies registered with us.
+        # Maps "container_proxy: [agent_id, ...]" for all WecsAgents
+        # registered with us:
+        self.wecs = {}
+
+        # Tuple with "(get_P, set_P_max, aids)" for each container.  Created
+        # by "freeze()" from "self.wecs":
+        self.wecs_calls = None
+
+        # The last set of limits that we sent to the WecsAgents.  "last_mode"
+        # is "limit" or "reset" (or None if we didn't send anything yet):
+        self.last_mode = None
+        self.last_P_max = None
 
         # Schedule the cyclic wind park feed-in check:
-        self.cycle_done = asyncio.Future()
+        self.cycle_done = asyncio.Event()
         self.t_check_feedin = aiomas.create_task(self.check_windpark_feedin())
 
     async def stop(self):
@@ -53,55 +67,110 @@ class Controller(aiomas.Agent):
         #     await asyncio.gather(*tasks, return_exceptions=True)
 
     @aiomas.expose
-    def register(self, wecs_proxy):
-        """Called by WecsAgents to register themselves with this controller."""
+    def register(self, container_proxy, aids):
+        """Register the WecsAgents *aids* living in the container managed by
+        *container_proxy*.
+
+        We talk to the agents through their container's manager so that we
+        only need one RPC per container (and not per agent) in each cycle.
+
+        """
+        registered = self.wecs.setdefault(container_proxy, [])
         # We don't want duplicate registrations:
-        assert wecs_proxy not in self.wecs
-        self.wecs.append(wecs_proxy)
+        assert not set(aids).intersection(registered)
+        registered.extend(aids)
+
+        # The new agents don't know our current limits, yet:
+        self.last_mode = None
+        self.wecs_calls = None
+
+    def freeze(self):
+        """Prepare the calls to the WecsAgents' containers once all agents are
+        registered.
+
+        The cyclic feed-in check then only iterates over a tuple and reuses
+        the proxies for the containers' ``get_P()`` and ``set_P_max()``
+        methods.  If agents get registered later, we freeze again.
+
+        """
+        self.wecs_calls = tuple((c.get_P, c.set_P_max, tuple(aids))
+                                for c, aids in self.wecs.items())
 
     @aiomas.expose
     async def step_done(self):
         """Used by the MosaikAgent to wait until one cycle of the feed-in check
         is done."""
-        await self.cycle_done
+        await self.cycle_done.wait()
+        # Reset the event so that the next call waits for the next cycle:
+        self.cycle_done.clear()
 
     async def check_windpark_feedin(self):
         """Background task that repeatedly checks if the cumulated feed-in of
         all WECS exceeds a given limit for the wind park."""
         # Repeat until cancelled:
         sleep_until = self.start_date  # Initial time; updated every cycle.
-        check_interval = self.check_interval
+        check_interval = timedelta(seconds=self.check_interval)
         max_feedin = self.max_windpark_feedin
 
         while True:
             await self.container.clock.sleep_until(sleep_until)
-            futs = [wecs.get_P() for wecs in self.wecs]
-            wecs_feedin = await asyncio.gather(*futs)
-            current_feedin = sum(wecs_feedin)
+            if self.wecs_calls is None:
+                self.freeze()
+            wecs = self.wecs_calls
+
+            # Collect the feed-in of all WECS (one list for each container) and
+            # flatten the results:
+            futs = [get_P(aids) for get_P, _, aids in wecs]
+            wecs_feedin = [P for Ps in await asyncio.gather(*futs) for P in Ps]
+            wecs_feedin = np.asarray(wecs_feedin, dtype=np.float64)
+            current_feedin = wecs_feedin.sum()
 
             if current_feedin > max_feedin:
                 # Set new power limits *P_max* for all WECS
-                factor = max_feedin / current_feedin
-                P_max = [P * factor for P in wecs_feedin]
-
-                # Check invariant: "sum(P_max) == max_feedin", but use
-                # subtraction to check float-equality
-                assert abs(sum(P_max) - max_feedin) < 0.01
-
-                # Prepare the calls to the WecsAgents
-                futs = [w.set_P_max(p) for (w, p) in zip(self.wecs, P_max)]
+                P_max = wecs_feedin * (max_feedin / current_feedin)
+
+                # Check invariant: "sum(P_max) == max_feedin", but with
+                # a tolerance for float-equality.  NumPy's (pairwise) sum is
+                # accurate enough for that.  The whole check, including the
+                # sum, is skipped if you run Python with "-O":
+                assert math.isclose(P_max.sum(), max_feedin, abs_tol=0.01)
+
+                if (self.last_mode == 'limit' and
+                        np.allclose(P_max, self.last_P_max)):
+                    # The WecsAgents already have these limits
+                    futs = []
+                else:
+                    self.last_mode = 'limit'
+                    self.last_P_max = P_max
+
+                    # Convert back to Python floats for the RPCs:
+                    P_max = P_max.tolist()
+
+                    # Prepare the calls to the containers.  "P_max" has the
+                    # same order as "wecs_feedin", so we split it into chunks:
+                    futs = []
+                    i = 0
+                    for _, set_P_max, aids in wecs:
+                        j = i + len(aids)
+                        futs.append(set_P_max(dict(zip(aids, P_max[i:j]))))
+                        i = j
+            elif self.last_mode == 'reset':
+                # *P_max* has already been reset for all WECS
+                futs = []
             else:
                 # Reset *P_max* for all WECS
-                # Prepare the calls to the WecsAgents
-                futs = [w.set_P_max(None) for w in self.wecs]
+                self.last_mode = 'reset'
+                self.last_P_max = None
+                # Prepare the calls to the containers
+                futs = [set_P_max(dict.fromkeys(aids))
+                        for _, set_P_max, aids in wecs]
 
             # Actually make the calls and wait until they’re done:
             await asyncio.gather(*futs)
 
-            # Set result for "cycle_done" so that the MosaikAgent knows we
-            # are ready.  Create a new future for the next cycle.
-            self.cycle_done.set_result(None)
-            self.cycle_done = asyncio.Future()
+            # Set the "cycle_done" event so that the MosaikAgent knows we are
+            # ready.  "step_done()" clears it again for the next cycle.
+            self.cycle_done.set()
 
             # Get the new time until which to sleep:
-            sleep_until = sleep_until.replace(seconds=check_interval)
+            sleep_until = sleep_until + check_interval
@@ -25,8 +25,11 @@ mosaik sends a *stop* message to the MAS.
 import asyncio
 import logging
 import multiprocessing
+import os
+import shutil
+import socket
 import sys
-import time
+import tempfile
 
 import aiomas
 import arrow
@@ -115,6 +118,10 @@ class MosaikAPI:
     host = 'localhost'
     port = 5678
 
+    # How many seconds we wait for the sub-processes during shutdown before we
+    # terminate them:
+    stop_timeout = 5
+
     def __init__(self, log_level):
         self.log_level = log_level
         # We have a step size of 15 minutes specified in seconds:
@@ -140,27 +147,36 @@ class MosaikAPI:
 
         # Set in "init()"
         self.sid = None  # Mosaik simulator ID
+        self.loop = None  # The event loop (its clock is used in "step()")
         self.container = None  # Root agent container
         self.start_date = None
         self.container_procs = []  # List of "(proc, container_proxy)" tuples
+        self.socket_dir = None  # Directory for the containers' Unix sockets
 
         # Updated in "setup_done()"
         self.agents = {}  # agent_id: agent_instance
 
         # Set/updated in "setup_done()"
         self.uids = {}  # agent_id: unit_id
-        self.t_last_step = None  # Used to measure the real-time a step takes
+        self.step_deadline = None  # Real-time by which a step must be done
 
     @aiomas.expose
-    async def init(self, sid, *, start_date, controller_config):
-        """Create a local agent container and the mosaik agent."""
+    async def init(self, sid, *, start_date, controller_config,
+                   max_containers=None):
+        """Create a local agent container and the mosaik agent.
+
+        We start one remote container for each CPU core, but at most
+        *max_containers* (if set) for the WecsAgents.
+
+        """
         self.sid = sid
+        self.loop = asyncio.get_event_loop()
         self.start_date = arrow.get(start_date).to('utc')
 
         # Root container for the MosaikAgent and Controller.  It will use the
         # ExternalClock which can be set by mosaik (see
         # "mas.util.get_container_kwargs()" for details):
-        container_kwargs = mas.util.get_container_kwargs(start_date)
+        container_kwargs = mas.util.get_container_kwargs(self.start_date)
         self.container = await aiomas.Container.create(
             (self.host, self.port), as_coro=True, **container_kwargs)
 
@@ -171,8 +187,12 @@ class MosaikAPI:
                                                     **controller_config)
 
         # Remote containers for WecsAgents
+        n_containers = multiprocessing.cpu_count()
+        if max_containers is not None:
+            n_containers = max(1, min(n_containers, max_containers))
         self.container_procs = await self._start_containers(
-            self.host, self.port + 1, start_date, self.log_level)
+            self.host, self.port + 1, start_date, self.log_level,
+            n_containers)
 
         return self.meta
 
@@ -186,19 +206,35 @@ class MosaikAPI:
         # Get the number of agents created so far and count from this number
         # when creating new entity IDs:
         n_agents = len(self.ma.agents)
+        eids = []
+        futs = []
+        new_agents = {}  # container_proxy: [agent_id, ...]
         for i in range(n_agents, n_agents + num):
             # Entity data
             eid = 'Agent_%s' % i
             entities.append({'eid': eid, 'type': model})
+            eids.append(eid)
 
             # Get a remote/sub container for the agent and spawn it.  Rember,
             # "self.container_procs" is a list of tuples and the proxy to the
             # container's manager agent is at index [1]:
             container = self.container_procs[i % len(self.container_procs)][1]
-            # We'll get a (proxy, addr) tuple, but only care for the proxy:
-            self.ma.agents[eid], _ = await container.spawn(
-                'mas.wecs:WecsAgent.create',
-                self.controller.addr, model_conf)
+            futs.append(container.spawn_agent(
+                eid, 'mas.wecs:WecsAgent', model_conf))
+            new_agents.setdefault(container, []).append(eid)
+
+        # Spawn all agents concurrently.  We'll get a (proxy, addr) tuple for
+        # each agent, but only care for the proxy:
+        results = await asyncio.gather(*futs)
+        for eid, (proxy, _) in zip(eids, results):
+            self.ma.agents[eid] = proxy
+
+        # Tell the MosaikAgent and the Controller which agents live in which
+        # container so that they can talk to all agents of a container at
+        # once:
+        for container, aids in new_agents.items():
+            self.ma.containers.setdefault(container, []).extend(aids)
+            self.controller.register(container, aids)
 
         return entities
 
@@ -209,18 +245,21 @@ class MosaikAPI:
         full_ids = ['%s.%s' % (self.sid, aid) for aid in self.ma.agents]
         relations = await self.mosaik.get_related_entities(full_ids)
         for full_aid, units in relations.items():
-            # We should only be connected to one entity
-            assert len(units) == 1
-            uid, _ = units.popitem()
+            # We should only be connected to one entity (the unpacking raises
+            # a ValueError if not):
+            uid, = units
             # Create a mapping "agent ID -> unit ID"
-            aid = full_aid.split('.')[-1]
+            aid = full_aid.rpartition('.')[2]
             self.uids[aid] = uid
 
-        # We need a reference (real-)time for measuring how long our step (see
-        # "step()") takes in real-time.  If we have a step size of x minutes,
-        # we want to make sure we don't spent more then x minutes of real-time
-        # within "step()".
-        self.t_last_step = time.monotonic()
+        # All WecsAgents are registered with the Controller now:
+        self.controller.freeze()
+
+        # We need a deadline (in real-time) for our step (see "step()").  If
+        # we have a step size of x minutes, we want to make sure we don't spent
+        # more then x minutes of real-time within "step()".  We use the event
+        # loop's (monotonic) clock for this:
+        self.step_deadline = self.loop.time() + self.step_size
 
     @aiomas.expose
     async def step(self, t, inputs):
@@ -233,29 +272,41 @@ class MosaikAPI:
         mosaik to continue the simulation.
 
         """
-        # Update the time for the agents:
-        futs = [c.set_time(t) for _, c in self.container_procs]
-        await asyncio.gather(*futs)
-        self.container.clock.set_time(t)
-
-        # Prepare input data and forward it to the agents:
+        # Prepare input data for the agents:
         data = {}
         for eid, attrs in inputs.items():
             input_data = {}
             for attr, values in attrs.items():
-                assert len(values) == 1  # b/c we're only connected to 1 unit
-                _, value = values.popitem()
+                # We're only connected to 1 unit, so "values" has exactly one
+                # entry (the unpacking raises a ValueError if not):
+                (_, value), = values.items()
                 input_data[attr] = value
-                data[eid] = input_data
-        await self.ma.update_agents(data)
+            data[eid] = input_data
+
+        # Update the time for the remote containers and forward the input data
+        # to the agents:
+        # "t" is an int (seconds since the start of the simulation), so the
+        # containers don't need to do any date parsing:
+        await self.ma.step(t, data)
+
+        # Update our own time only now, so that the Controller does not start
+        # its next cycle before the agents have received their new data:
+        self.container.clock.set_time(t)
 
         # Check if we got new schedules and send them to mosaik.  Since we
-        # could, in theory, wait longer then "step_size" seconds, we calculate
-        # a timeout.  This timeout is "step_size - time_we_used_so_far" long:
-        timeout = self.t_last_step + self.step_size - time.monotonic()
+        # could, in theory, wait longer then "step_size" seconds, we wait at
+        # most until "self.step_deadline":
         try:
-            await asyncio.wait_for(self.controller.step_done(),
-                                   timeout=timeout)
+            if hasattr(asyncio, 'timeout_at'):
+                # Python >= 3.11 can directly use the deadline and doesn't
+                # need to wrap "step_done()" in a new task:
+                async with asyncio.timeout_at(self.step_deadline):
+                    await self.controller.step_done()
+            else:
+                # This timeout is "step_size - time_we_used_so_far" long:
+                timeout = max(0, self.step_deadline - self.loop.time())
+                await asyncio.wait_for(self.controller.step_done(),
+                                       timeout=timeout)
         except asyncio.TimeoutError as e:
             # Instead of raising an error here, we could as well let our agents
             # continue with their calculations in the background (because they
@@ -264,8 +315,8 @@ class MosaikAPI:
             raise RuntimeError('Agent system did not finish its step within '
                                '%s seconds' % self.step_size) from e
 
-        # Get new reference time for the next "step()":
-        self.t_last_step = time.monotonic()
+        # Get a new deadline for the next "step()":
+        self.step_deadline = self.loop.time() + self.step_size
 
         # Make "set_data()" call back to mosaik to send the set-points:
         new_P_max = await self.ma.get_P_max()
@@ -284,16 +335,38 @@ class MosaikAPI:
     async def finalize(self):
         """Stop all agents and sub-processes and wait for them to terminate.
         """
-        # We collect a list of futures and wit for all of them at once:
-        futs = []
-        for proc, container_proxy in self.container_procs:
-            # Send a "stop" message to the remote container and wait for the
-            # corresponding subprocess to terminate:
-            futs.append(container_proxy.stop())
-            futs.append(proc.wait())
-
-        # Wait for the futures to finish:
-        await asyncio.gather(*futs)
+        # Send a "stop" message to all remote containers.  A container that
+        # crashed or hangs must not block our shutdown, so we only wait
+        # "stop_timeout" seconds:
+        futs = [asyncio.ensure_future(self._stop_container(c))
+                for _, c in self.container_procs]
+        if futs:
+            _, pending = await asyncio.wait(futs, timeout=self.stop_timeout)
+            for fut in pending:
+                fut.cancel()
+
+        # Wait for the subprocesses to terminate.  Terminate the ones that
+        # didn't stop in time and kill the ones that ignore that, too:
+        procs = [p for p, _ in self.container_procs]
+        futs = [asyncio.ensure_future(p.wait()) for p in procs]
+        if futs:
+            _, pending = await asyncio.wait(futs, timeout=self.stop_timeout)
+            if pending:
+                for proc in procs:
+                    if proc.returncode is None:
+                        logger.warning('Terminating container process %s',
+                                       proc.pid)
+                        proc.terminate()
+                _, pending = await asyncio.wait(pending,
+                                                timeout=self.stop_timeout)
+            if pending:
+                for proc in procs:
+                    if proc.returncode is None:
+                        logger.warning('Killing container process %s',
+                                       proc.pid)
+                        proc.kill()
+                # A killed process can't refuse to stop:
+                await asyncio.gather(*pending)
 
         await self.controller.stop()
 
@@ -302,14 +375,42 @@ class MosaikAPI:
         # as well:
         await self.container.shutdown(as_coro=True)
 
-    async def _start_containers(self, host, start_port, start_date, log_level):
-        """Start one container (process) on each CPU core."""
+        # The sub-processes are gone, so we can remove their sockets:
+        if self.socket_dir is not None:
+            shutil.rmtree(self.socket_dir, ignore_errors=True)
+
+    async def _stop_container(self, container_proxy):
+        """Send a *stop* message to a remote container and log (but ignore)
+        errors."""
+        try:
+            await container_proxy.stop()
+        except Exception as e:
+            logger.warning('Could not stop container %s: %r',
+                           container_proxy, e)
+
+    async def _start_containers(self, host, start_port, start_date, log_level,
+                                n_containers):
+        """Start *n_containers* containers (processes).
+
+        If the OS supports it, the containers listen on Unix domain sockets
+        which are faster than (local) TCP sockets.  Else, they use TCP sockets
+        on *host* and the ports counting up from *start_port*.
+
+        """
+        if hasattr(socket, 'AF_UNIX'):
+            self.socket_dir = tempfile.mkdtemp(prefix='mas-')
+
         addrs = []  # Container addresses
         procs = []  # Subprocess instances
-        for i in range(multiprocessing.cpu_count()):
+        for i in range(n_containers):
             # We define a network address for the new container, ...
-            addr = (host, start_port + i)
-            addrs.append('tcp://%s:%s/0' % addr)
+            if self.socket_dir is not None:
+                path = os.path.join(self.socket_dir, 'container-%s' % i)
+                addrs.append('ipc://[%s]/0' % path)
+                addr = 'ipc://%s' % path
+            else:
+                addrs.append('tcp://%s:%s/0' % (host, start_port + i))
+                addr = '%s:%s' % (host, start_port + i)
             # ... and build the command for starting the subprocess.  We want
             # to use the same interpreter we currently use to run the
             # "mas.container" module.  We also pass some command line args:
@@ -318,17 +419,19 @@ class MosaikAPI:
                 '-m', 'mas.container',
                 '--start-date=%s' % start_date,
                 '--log-level=%s' % log_level,
-                '%s:%s' % addr,
+                addr,
             ]
             # ... We finally create a task for starting the subprocess:
             procs.append(asyncio.create_subprocess_exec(*cmd))
 
         # Start all processes and connect to them.  Since it may take a while
         # until a process is listening on its socket, we use a timeout of 10s
-        # in the "connect()" call.
-        procs = await asyncio.gather(*procs)
+        # in the "connect()" call.  "connect()" retries until the container is
+        # ready, so we don't need to wait for the processes to be started
+        # before we begin connecting:
         futs = [self.container.connect(a, timeout=10) for a in addrs]
-        containers = await asyncio.gather(*futs)
+        procs, containers = await asyncio.gather(asyncio.gather(*procs),
+                                                 asyncio.gather(*futs))
 
         # Return a list of "(proc, container_proxy)" tuples:
         return [(p, c) for p, c in zip(procs, containers)]
@@ -348,21 +451,37 @@ class MosaikAgent(aiomas.Agent):
         # it spawns new WecsAgents:
         self.agents = {}
 
-    async def update_agents(self,  data):
-        """Update the agents with new data from mosaik."""
-        futs = [self.agents[aid].update_state(input_data)
-                for aid, input_data in data.items()]
+        # Maps "container_proxy: [agent_id, ...]".  Also filled by the mosaik
+        # API.  We use it to make only one call per container instead of one
+        # call per agent:
+        self.containers = {}
+
+    async def step(self, t, data):
+        """Set the time of all remote containers to *t* and update the agents
+        with new data from mosaik.
+
+        *t* is the simulation time in seconds (an int).  We only need one call
+        per container for this.
+
+        """
+        futs = [
+            c.step(t, {aid: data[aid] for aid in aids if aid in data})
+            for c, aids in self.containers.items()
+        ]
         await asyncio.gather(*futs)
 
     async def get_P_max(self):
         """Collect new set-points (P_max values) from the agents and return
         them to the mosaik API."""
-        # "asyncio.gather()" returns only a list, but here, we need a mapping
-        # "aid: P_max".  Thus, we first create a mapping "aid: future" and
-        # once the futures completed, transform the dict to the one we need:
-        futs = {aid: a.get_P_max() for aid, a in self.agents.items()}
-        await asyncio.gather(*(fut for fut in futs.values()))
-        P_max = {aid: fut.result() for aid, fut in futs.items()}
+        # Each container returns a list with the P_max values of the agents
+        # we asked for.  We zip these lists with the agent IDs to get the
+        # mapping "aid: P_max" that we need:
+        containers = list(self.containers.items())
+        futs = [c.get_P_max(aids) for c, aids in containers]
+        results = await asyncio.gather(*futs)
+        P_max = {}
+        for (_, aids), values in zip(containers, results):
+            P_max.update(zip(aids, values))
 
         return P_max
 
@@ -8,19 +8,29 @@ def get_container_kwargs(start_date):
     """Return a dictionary with keyword arguments *(kwargs)* used by both, the
     root container, and the containers in the sub processes.
 
-    *start_date* is an Arrow date-time object used to initialize the container
-    clock.
+    *start_date* is an Arrow date-time object or an ISO-8601 date string used
+    to initialize the container clock.  Pass an Arrow object (in UTC) if you
+    already have one, so that the date doesn't need to be parsed again.
 
     """
+    # Our messages are tiny (mostly a few floats), so compressing them with
+    # "MsgPackBlosc" would cost more time than it saves:
     return {
         'clock': aiomas.ExternalClock(start_date, init_time=-1),
-        'codec': aiomas.MsgPackBlosc,
+        'codec': aiomas.MsgPack,
     }
 
 
 def validate_addr(ctx, param, value):
     """*Click* validator that makes sure that *value* is a valid address
-    *host:port*."""
+    *host:port*.
+
+    A value *ipc://path* denotes a Unix domain socket.  In this case, only the
+    *path* is returned.
+
+    """
+    if value.startswith('ipc://'):
+        return value[len('ipc://'):]
     try:
         host, port = value.rsplit(':', 1)
         return (host, int(port))
@@ -5,14 +5,13 @@ Implementation of the `mosaik API`_ for the WECS sim.
    https://mosaik.readthedocs.org/en/latest/mosaik-api/high-level.html
 
 """
-from collections import namedtuple
 import io
 import lzma
 
 import mosaik_api
 import numpy as np
 
-from .wecs import WECS
+from .wecs import DTYPE, WECS
 
 
 # The meta data that the "init()" call will return.
@@ -38,9 +37,6 @@ META = {
 }
 STEP_SIZE = 15  # minutes
 
-# Used to store a single WECS' config parameters
-WecsConfig = namedtuple('WecsConfig', 'P_rated, v_rated, v_min, v_max')
-
 
 class WecsSim(mosaik_api.Simulator):
     """This class implements the mosaik API."""
@@ -49,10 +45,26 @@ class WecsSim(mosaik_api.Simulator):
         # it and store it as "self.meta":
         super().__init__(META)
 
-        self.wind_file = None  # File handle for wind velocities
-        self.wecs = {}  # Maps EIDs to wecs index
-        self.wecs_config = []  # List of WecsConfig tuples
+        # Wind velocities with one row per time step.  "setup_done()" expands
+        # it to one column per WECS:
+        self.wind = None
+        self.wind_idx = 0  # Row index for the next step
+        # Maps EIDs to wecs index.  Although the index is part of the EID,
+        # looking it up is a lot faster than parsing it with "int(eid[5:])":
+        self.wecs = {}
+        # Buffer for the WECS' config parameters with one row per WECS and
+        # one column per param (in the order of META's "params" list).  It
+        # grows as needed in "create()".  "self.wecs_config" is a view on
+        # the used rows:
+        self.config_buf = np.empty((16, 4), dtype=DTYPE)
+        self.wecs_config = self.config_buf[:0]
         self.sim = None  # WECS sim instance
+        # Set of valid attribute names for fast lookups in "get_data()":
+        self.attrs = frozenset(self.meta['models']['WECS']['attrs'])
+
+        # Set in "setup_done()":
+        self.P_max = None  # Buffer for the P_max vector passed to the sim
+        self.P_max_idx = []  # Indices of the P_max values set in the last step
 
     def init(self, sid, wind_file):
         """*wind_file* is a CSV file containing one or more time series for
@@ -74,8 +86,12 @@ class WecsSim(mosaik_api.Simulator):
         reused multiple times using modulo (``ts_idx = wecs_idx % ts_count``).
 
         """
+        # The time series are small enough to load and parse them all at
+        # once.  "step()" then only needs to pick the next row:
         open = lzma.open if wind_file.endswith('.xz') else io.open
-        self.wind_file = open(wind_file, 'rt')
+        with open(wind_file, 'rt') as f:
+            self.wind = np.loadtxt(f, dtype=DTYPE, delimiter=',', ndmin=2)
+        self.wind_idx = 0
 
         # Return our simulator's meta data to mosaik:
         return self.meta
@@ -92,14 +108,27 @@ class WecsSim(mosaik_api.Simulator):
 
         """
         n_wecs = len(self.wecs_config)  # Number of WECS so far
+        n_total = n_wecs + num
+        if n_total > len(self.config_buf):
+            # Grow the buffer to at least twice its size, so that we don't
+            # need to copy it for every "create()" call:
+            config_buf = np.empty((max(2 * len(self.config_buf), n_total), 4),
+                                  dtype=DTYPE)
+            config_buf[:n_wecs] = self.wecs_config
+            self.config_buf = config_buf
+
+        # Store the config for the new entities.  NumPy copies the row with
+        # the params into all rows of the slice:
+        params = self.meta['models'][model]['params']
+        self.config_buf[n_wecs:n_total] = [wecs_params[p] for p in params]
+        self.wecs_config = self.config_buf[:n_total]
+
         entities = []  # This will hold the entity data for mosaik
-        for wecs_idx in range(n_wecs, n_wecs + num):
+        for wecs_idx in range(n_wecs, n_total):
             # The entity ID for mosaik:
             eid = 'wecs-%s' % wecs_idx
-            # Remember the index of the current entity in "self.wecs_config"
-            # and store the config for the current entity:
+            # Remember the index of the current entity in "self.wecs_config":
             self.wecs[eid] = wecs_idx
-            self.wecs_config.append(WecsConfig(**wecs_params))
 
             # Add entity data for mosaik
             entities.append({'eid': eid, 'type': model})
@@ -115,20 +144,30 @@ class WecsSim(mosaik_api.Simulator):
         simulator with it.
 
         """
-        # Create a NumPy array with one row for each WECS.  This works because
-        # "self.wecs_config" is just a list of tuples that contain only float
-        # numbers:
-        config = np.array(self.wecs_config, dtype=float)
-
-        # Config stores the data row-wise, but the sim needs the data
+        # "self.wecs_config" is already a NumPy array with one row for each
+        # WECS.  It stores the data row-wise, but the sim needs the data
         # column-wise, so we just transpose the array and expand it into the
         # four columns "P_rated", "v_rated", "v_min", "v_max".
-        self.sim = WECS(*config.T)
+        self.sim = WECS(*self.wecs_config.T)
         # The upper code is equivalent to this:
         #
-        #   P_rated, v_rated, v_min, v_max = config.T
+        #   P_rated, v_rated, v_min, v_max = self.wecs_config.T
         #   self.sim = WECS(P_rated, v_rated, v_min, v_max)
 
+        # The number of time series may be smaller than the number of WECS
+        # (see "init()"), so we need to expand the wind data once.  Indexing
+        # the columns with "i % n_series" repeats the time series as often as
+        # needed.  NumPy returns the result in column-major order, so we
+        # explicitly make it row-major.  Each row that we pass to the sim is
+        # then a contiguous vector:
+        n_series = self.wind.shape[1]
+        self.wind = np.ascontiguousarray(
+            self.wind[:, np.arange(len(self.wecs)) % n_series])
+
+        # We reuse the same P_max vector in every step (see "step()"):
+        self.P_max = self.sim.P_rated.copy()
+        self.P_max_idx = []
+
         # This method has no return value
 
     def step(self, time, inputs):
@@ -146,31 +185,40 @@ class WecsSim(mosaik_api.Simulator):
             }
 
         """
-        # Generate a new vector with P_Max values.  Use P_rated as default and
-        # override the default value if necessary:
-        P_max = self.sim.P_rated.copy()
+        # Update the vector with P_Max values.  Use P_rated as default and
+        # override the default value if necessary.  Instead of creating a new
+        # vector from P_rated in each step, we only reset the values that we
+        # overrode in the last step.  The new values are collected in lists
+        # and then stored with a single NumPy operation:
+        P_max = self.P_max
+        P_max[self.P_max_idx] = self.sim.P_rated[self.P_max_idx]
+        P_max_idx = []
+        P_max_values = []
+        wecs = self.wecs  # Avoid the attribute lookup in the loop
         for eid, wecs_inputs in inputs.items():
-            idx = self.wecs[eid]
             if 'P_max' in wecs_inputs:
                 # "wecs_inputs" must be a dict with only one entry, because
                 # there is a 1:1 relation between WECS and agent:
                 # wecs_inputs == {'P_max': {'src_eid': p_max_i}}
-                assert len(wecs_inputs['P_max']) == 1
+                wecs_P_max = wecs_inputs['P_max']
+                assert len(wecs_P_max) == 1
                 # Pop the single value from the dict:
-                _, p_max_i = wecs_inputs['P_max'].popitem()
-                P_max[idx] = p_max_i
+                _, p_max_i = wecs_P_max.popitem()
+                P_max_idx.append(wecs[eid])
+                P_max_values.append(p_max_i)
+        P_max_idx = np.array(P_max_idx, dtype=np.intp)
+        P_max[P_max_idx] = np.array(P_max_values, dtype=DTYPE)
+        self.P_max_idx = P_max_idx
 
         # Set the P_max vector to the simulator:
         self.sim.set_P_max(P_max)
 
-        # Get current wind velocities from the file and step the sim:
-        data = next(self.wind_file).strip().split(',')
-        data = [float(val) for val in data]
-        data_len = len(data)
-        wecs_count = len(self.wecs)
-        # "data_len" may be smaller than "wecs_count" (see "init()"),
-        # so we need to expand it:
-        data = np.array([data[i % data_len] for i in range(wecs_count)])
+        # Get the current wind velocities and step the sim.  Like with
+        # "next(file)", we raise a StopIteration if we run out of data:
+        if self.wind_idx >= len(self.wind):
+            raise StopIteration
+        data = self.wind[self.wind_idx]
+        self.wind_idx += 1
         self.sim.step(data)
 
         # We want to do our next step in STEP_SIZE minutes:
@@ -195,17 +243,25 @@ class WecsSim(mosaik_api.Simulator):
             }
 
         """
+        # Instead of converting each single value to a Python float, we
+        # convert the whole array of an attribute to a list of floats (with
+        # a single NumPy operation) the first time it is requested:
+        values = {}  # Maps "attr: list_of_values"
         data = {}
         for eid, attrs in outputs.items():
-            if eid not in self.wecs:
-                raise ValueError('Unknown entity ID "%s"' % eid)
+            try:
+                idx = self.wecs[eid]
+            except KeyError:
+                raise ValueError('Unknown entity ID "%s"' % eid) from None
 
-            idx = self.wecs[eid]
             data[eid] = {}
             for attr in attrs:
-                if attr not in self.meta['models']['WECS']['attrs']:
-                    raise AttributeError('Attribute "%s" not available' % attr)
-                data[eid][attr] = float(getattr(self.sim, attr)[idx])
+                if attr not in values:
+                    if attr not in self.attrs:
+                        raise AttributeError('Attribute "%s" not available' %
+                                             attr)
+                    values[attr] = getattr(self.sim, attr).tolist()
+                data[eid][attr] = values[attr][idx]
 
         return data
 
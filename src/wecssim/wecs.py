@@ -36,11 +36,21 @@ output.
 
 In order to speed up computation, we don't represent multiple WECS as multiple
 instances of :class:`WECS` but use one NumPy array for each attribute which
-contain the values for all simulated instances.
+contain the values for all simulated instances.  All arrays that :class:`WECS`
+creates are contiguous, because NumPy processes one whole array after the
+other.  Interleaving the attributes of each WECS in one 2D array would make the
+array views strided and "step()" about twice as slow.  For the same reason,
+callers should pass a contiguous wind velocity vector to "step()".  The
+calculations only use NumPy's precompiled ufuncs, so (unlike with a JIT
+compiler) the first step is not slower than the others.
 
 The maximum power output of a WECS can be controlled (by an external party) by
 setting the *P_max* attribute.
 
+All arrays use single precision floats (see :data:`DTYPE`).  That's precise
+enough for power values in kW and halves the memory that we need to move
+around in each step.
+
 """
 import numpy as np
 
@@ -48,6 +58,8 @@ import numpy as np
 HOUR = 60  # An hour has 60 minutes
 STEP_MINUTES = 15
 
+DTYPE = np.float32  # Data type for all arrays
+
 P_rated = 5000  # kW
 v_min = 3.5  # m/s
 v_rated = 13  # m/s
@@ -61,9 +73,15 @@ class WECS:
         All four arguments need to be NumPy arrays of the same length.  That
         means, the first WECS is represented by ``P_rated[0]``, ``v_rated[0]``,
         ``v_min[0]`` and ``v_max[0]``.  The second one by ``P_rated[1]``,
-        ``v_rated[1]``, ..., and so forth.
+        ``v_rated[1]``, ..., and so forth.  They are converted to contiguous
+        :data:`DTYPE` arrays (if they aren't already).
 
         """
+        P_rated = np.ascontiguousarray(P_rated, dtype=DTYPE)
+        v_rated = np.ascontiguousarray(v_rated, dtype=DTYPE)
+        v_min = np.ascontiguousarray(v_min, dtype=DTYPE)
+        v_max = np.ascontiguousarray(v_max, dtype=DTYPE)
+
         # All input vectors should be of the same length
         self.count = len(P_rated)
         assert len(v_rated) == self.count
@@ -89,43 +107,71 @@ class WECS:
         self.v_min.setflags(write=False)
         self.v_max.setflags(write=False)
 
-        self.P_max = P_rated  # Current power output limit for all WECS
+        # "P = (v_rated ** -3) * (v ** 3) * P_rated" (see above) has the
+        # constant factor "P_rated / v_rated**3", so we only calculate it once:
+        self.P_coeff = self.P_rated / self.v_rated ** 3
+        self.P_coeff.setflags(write=False)
+
+        # Current power output limit for all WECS.  "set_P_max()" updates
+        # this array in-place:
+        self.P_max = P_rated.copy()
 
-        self.P = None  # Current power output of all WECS
+        # Current power output of all WECS.  "step()" updates this array
+        # in-place:
+        self.P = np.zeros(self.count, dtype=DTYPE)
         self.v = None  # Current wind speed for all WECS
 
+        # Buffers for the "v_min <= v <= v_max" mask in "step()":
+        self.mask = np.empty(self.count, dtype=bool)
+        self.mask_tmp = np.empty(self.count, dtype=bool)
+
     def step(self, v):
         """Update the current power output "self.P" based on the wind velocity
         vector
         *v*.
 
-        *v* must be a NumPy array with the same length as "self.P_rated".
+        *v* must be a NumPy array with the same length as "self.P_rated".  It
+        may be any 1D view (e.g., a row of a larger matrix), but it should be
+        contiguous.  A strided view works, but makes this method several times
+        slower.  *v* is stored as "self.v" without copying it.
 
         """
         # Check "v" and store it:
         assert len(v) == self.count
         self.v = v
 
-        # Calculate the theoretical power output:
-        P = (self.v_rated ** -3) * (v ** 3) * self.P_rated
-        # Set it to 0 if there to little or to much wind:
-        P[(v < self.v_min) | (v > self.v_max)] = 0
-        # Trim it if it exceeds P_rated or P_max:
-        P = np.minimum(P, self.P_rated)
-        P = np.minimum(P, self.P_max)
+        # We do all calculations in-place on "self.P" so that we don't need to
+        # allocate temporary arrays for each intermediate result.
+        P = self.P
 
-        # Set new state:
-        self.P = P
+        # Calculate the theoretical power output:
+        np.power(v, 3, out=P)
+        P *= self.P_coeff
+        # Set it to 0 if there to little or to much wind.  Multiplying with
+        # the boolean mask (0 or 1) is faster than assigning 0 to the
+        # masked elements.  The mask is also computed in-place:
+        mask = self.mask
+        np.greater_equal(v, self.v_min, out=mask)
+        np.less_equal(v, self.v_max, out=self.mask_tmp)
+        np.logical_and(mask, self.mask_tmp, out=mask)
+        np.multiply(P, mask, out=P)
+        # Trim it if it exceeds P_max.  Since P_max is never larger than
+        # P_rated (see "set_P_max()"), this also trims it to P_rated:
+        np.minimum(P, self.P_max, out=P)
 
     def set_P_max(self, P_max):
         """Set a vector with new power limits.
 
         *P_max* must be a NumPy array with the same length as "self.P_rated".
-        All values must be in the interval [0, P_rated].
+        All values must be in the interval [0, P_rated].  This is only
+        checked if Python runs without the ``-O`` flag, but values above
+        P_rated are always trimmed to P_rated.
 
         """
         assert len(P_max) == self.count
         assert np.all(P_max >= 0)
         assert np.all(P_max <= self.P_rated)
 
-        self.P_max = P_max
+        # "step()" relies on "P_max <= P_rated", so we enforce it here once
+        # instead of trimming P to P_rated in every step:
+        np.minimum(P_max, self.P_rated, out=self.P_max)
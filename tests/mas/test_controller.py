@@ -0,0 +1,124 @@
+import asyncio
+
+import aiomas
+import arrow
+import pytest
+
+from mas.controller import Controller
+import mas.util
+
+
+START_DATE = arrow.get('2010-03-27T00:00:00+01:00').to('utc')
+CHECK_INTERVAL = 900  # seconds
+MAX_FEEDIN = 30
+
+
+class FakeContainerProxy:
+    """Replaces the proxy to a container's Manager.  It returns the power
+    output from *P* ``{aid: P}`` and records all ``set_P_max()`` calls."""
+    def __init__(self, P):
+        self.P = P
+        self.P_max_calls = []
+
+    async def get_P(self, aids):
+        return [self.P[aid] for aid in aids]
+
+    async def set_P_max(self, P_max):
+        self.P_max_calls.append(P_max)
+
+
+@pytest.fixture
+def controller(request, tmpdir):
+    container = aiomas.Container.create(
+        tmpdir.join('ctrl').strpath,
+        **mas.util.get_container_kwargs(START_DATE))
+    controller = Controller(container,
+                            start_date=START_DATE,
+                            check_interval=CHECK_INTERVAL,
+                            max_windpark_feedin=MAX_FEEDIN)
+    # Let the feed-in check task start and wait for the first check:
+    aiomas.run(until=asyncio.sleep(0))
+
+    def finalize():
+        aiomas.run(until=controller.stop())
+        container.shutdown()
+
+    request.addfinalizer(finalize)
+    return controller
+
+
+def run_cycle(controller, cycle):
+    """Set the clock to the time of the *cycle*-th feed-in check and wait
+    until the check is done.
+
+    Fail if the Controller doesn't set its "cycle_done" event in time.
+
+    """
+    controller.container.clock.set_time(cycle * CHECK_INTERVAL)
+    aiomas.run(until=asyncio.wait_for(controller.step_done(), 1))
+
+
+def test_limit_not_sent_twice(controller):
+    proxy = FakeContainerProxy({'a0': 20, 'a1': 20})
+    controller.register(proxy, ['a0', 'a1'])
+
+    run_cycle(controller, 0)
+    assert proxy.P_max_calls == [{'a0': 15, 'a1': 15}]
+
+    # Same feed-in, same limits:
+    run_cycle(controller, 1)
+    assert proxy.P_max_calls == [{'a0': 15, 'a1': 15}]
+
+    # New limits are sent again:
+    proxy.P = {'a0': 40, 'a1': 20}
+    run_cycle(controller, 2)
+    assert proxy.P_max_calls == [
+        {'a0': 15, 'a1': 15},
+        {'a0': 20, 'a1': 10},
+    ]
+
+
+def test_reset_sent_once(controller):
+    proxy = FakeContainerProxy({'a0': 20, 'a1': 20})
+    controller.register(proxy, ['a0', 'a1'])
+
+    run_cycle(controller, 0)
+
+    proxy.P = {'a0': 10, 'a1': 10}
+    run_cycle(controller, 1)
+    run_cycle(controller, 2)
+    assert proxy.P_max_calls == [
+        {'a0': 15, 'a1': 15},
+        {'a0': None, 'a1': None},
+    ]
+
+
+def test_register_forces_resend(controller):
+    proxy_0 = FakeContainerProxy({'a0': 20, 'a1': 20})
+    controller.register(proxy_0, ['a0', 'a1'])
+
+    run_cycle(controller, 0)
+    run_cycle(controller, 1)  # Skipped
+    assert proxy_0.P_max_calls == [{'a0': 15, 'a1': 15}]
+
+    # The new agent doesn't change the limits of the others, but they must
+    # be sent to all containers again:
+    proxy_1 = FakeContainerProxy({'a2': 0})
+    controller.register(proxy_1, ['a2'])
+    run_cycle(controller, 2)
+    assert proxy_0.P_max_calls == [
+        {'a0': 15, 'a1': 15},
+        {'a0': 15, 'a1': 15},
+    ]
+    assert proxy_1.P_max_calls == [{'a2': 0}]
+
+
+def test_cycle_done_on_skipped_cycles(controller):
+    proxy = FakeContainerProxy({'a0': 10})
+    controller.register(proxy, ['a0'])
+
+    # "run_cycle()" fails if "cycle_done" is not set.  Only the first cycle
+    # sends the reset, the others are skipped:
+    for cycle in range(3):
+        run_cycle(controller, cycle)
+    assert proxy.P_max_calls == [{'a0': None}]
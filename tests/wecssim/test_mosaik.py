@@ -22,7 +22,7 @@ def test_wecssim(wind_file):
     wecssim.init('wecssim-0', wind_file)
 
     assert not wecssim.wecs
-    assert not wecssim.wecs_config
+    assert len(wecssim.wecs_config) == 0
 
     ret = wecssim.create(2, 'WECS', P_rated=10, v_rated=10, v_min=1, v_max=15)
     assert ret == [
@@ -75,3 +75,48 @@ def test_wecssim(wind_file):
     }
 
     pytest.raises(StopIteration, wecssim.step, 1800, {})
+
+
+def test_wecssim_reset_P_max(wind_file):
+    wecssim = WecsSim()
+    wecssim.init('wecssim-0', wind_file)
+    wecssim.create(2, 'WECS', P_rated=10, v_rated=10, v_min=1, v_max=15)
+    wecssim.setup_done()
+
+    wecssim.step(0, {'wecs-1': {'P_max': {'src': 5}}})
+    outputs = {'wecs-0': ['P', 'P_max'], 'wecs-1': ['P', 'P_max']}
+    ret = wecssim.get_data(outputs)
+    assert ret == {
+        'wecs-0': {'P': 1.25, 'P_max': 10},
+        'wecs-1': {'P': 5, 'P_max': 5},
+    }
+
+    # Without new inputs, P_max is reset to P_rated:
+    wecssim.step(900, {})
+    ret = wecssim.get_data(outputs)
+    assert ret == {
+        'wecs-0': {'P': 10, 'P_max': 10},
+        'wecs-1': {'P': 10, 'P_max': 10},
+    }
+
+
+def test_wecssim_create_many(wind_file):
+    wecssim = WecsSim()
+    wecssim.init('wecssim-0', wind_file)
+    wecssim.create(10, 'WECS', P_rated=10, v_rated=10, v_min=1, v_max=15)
+    wecssim.create(30, 'WECS', P_rated=20, v_rated=12, v_min=2, v_max=16)
+
+    assert len(wecssim.wecs_config) == 40
+    assert wecssim.wecs_config[9].tolist() == [10, 10, 1, 15]
+    assert wecssim.wecs_config[39].tolist() == [20, 12, 2, 16]
+
+
+def test_wecssim_wind_rows_contiguous(wind_file):
+    wecssim = WecsSim()
+    wecssim.init('wecssim-0', wind_file)
+    wecssim.create(5, 'WECS', P_rated=10, v_rated=10, v_min=1, v_max=15)
+    wecssim.setup_done()
+
+    assert wecssim.wind.shape == (2, 5)
+    assert wecssim.wind[0].tolist() == [5, 10, 5, 10, 5]
+    assert wecssim.wind[0].flags['C_CONTIGUOUS']
@@ -1,3 +1,7 @@
+import os.path
+import subprocess
+import sys
+
 import numpy as np
 
 from wecssim.wecs import WECS
@@ -22,3 +26,20 @@ def test_sim():
     wecs.set_P_max(np.array([0, 0, 5, 5, 10, 10]))
     wecs.step(np.array([0, 10, 5, 10, 10, 10]))
     assert np.allclose(wecs.P, [0, 0, 1.25, 5, 10, 10])
+
+
+def test_sim_P_max_above_P_rated():
+    """Without asserts (``python -O``), P must still not exceed P_rated."""
+    code = (
+        'import numpy as np\n'
+        'from wecssim.wecs import WECS\n'
+        'wecs = WECS(np.full(2, 10), np.full(2, 10), np.full(2, 1), '
+        'np.full(2, 15))\n'
+        'wecs.set_P_max(np.array([5, 20]))\n'
+        'wecs.step(np.array([12, 12]))\n'
+        'print(wecs.P.tolist(), wecs.P_max.tolist())\n'
+    )
+    src = os.path.join(os.path.dirname(__file__), '..', '..', 'src')
+    env = dict(os.environ, PYTHONPATH=src)
+    out = subprocess.check_output([sys.executable, '-O', '-c', code], env=env)
+    assert out.decode().strip() == '[5.0, 10.0] [5.0, 10.0]'